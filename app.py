@@ -1,24 +1,112 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+from urllib.parse import quote
 import io
 from datetime import datetime
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 import time
 import os
 import json
+import tempfile
+import atexit
+from collections import OrderedDict
+from contextlib import nullcontext
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # For Google API integration
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession
+import httplib2
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from google_sheets_utils import (CLIENT_CACHE_ENTRIES, CLIENT_CACHE_TTL, batch_get_values, build_sheets_service,
+                                 credentials_from_token_info, ensure_fresh, extract_sheet_id, load_oauth_client_config,
+                                 token_fingerprint, token_needs_refresh, with_backoff)
 
 # --- Google API Constants and Authentication Setup ---
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-CREDENTIALS_FILE = 'credentials.json'
+SHEETS_API_URL = 'https://sheets.googleapis.com/v4'
+CSV_FETCH_WORKERS = 8
+DATA_CACHE_SIZE = 16
+API_CACHE_TTL = 600  # seconds that fetched sheet data is reused before asking Google again
+DATA_CACHE_TTL = API_CACHE_TTL
+CSV_CHUNK_ROWS = 50_000
+# Export bytes are large, so only a few are kept, and not for long
+EXPORT_CACHE_ENTRIES = 4
+EXPORT_CACHE_TTL = 600
+# Excel worksheet limits, including the header row
+XLSX_MAX_ROWS = 1_048_576
+XLSX_MAX_COLS = 16_384
+EXPORT_TEMPFILE_TTL = 3600  # seconds a large-export temp file is kept before it may be pruned
+PAGE_CHUNK_SIZE = 64 * 1024
+PAGE_CHUNK_OVERLAP = 1024
+PAGE_IDLE_CHUNKS = 4
+# Typed values return dates as serial day counts; these number formats mark the columns to convert
+DATE_NUMBER_FORMATS = ('DATE', 'DATE_TIME')
+DATE_SAMPLE_ROWS = 10  # rows below the header whose cell formats decide whether a column holds dates
+SERIAL_DATE_ORIGIN = '1899-12-30'
+
+# Patterns for parsing sheet gids and tab names out of URLs and public edit pages
+_SHEET_GID_RE = re.compile(r'[#?&]gid=(\d+)')
+_SHEET_NAME_KEYS = ('sheetName', 'title', 'name', 'properties')  # in order of preference
+_SHEET_NAME_RE = re.compile(r'"(sheetName|title|name)":"([^"]+)","sheetId":(\d+)')
+_SHEET_PROPS_RE = re.compile(r'{"properties":{"sheetId":(\d+),"title":"([^"]+)"')
+
+def _quote_sheet_name(name: str) -> str:
+    """Quote a sheet name for A1 notation, doubling any single quotes inside it."""
+    return "'" + name.replace("'", "''") + "'"
+
+def _create_http_session() -> requests.Session:
+    """Create a pooled HTTP session that retries rate-limited and failed requests with backoff."""
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+def _token_expired_without_refresh() -> bool:
+    """Check whether the signed-in token has no refresh token and is about to expire."""
+    token_info = st.session_state.get("sheets_token_info")
+    if not token_info or token_info.get("refresh_token"):
+        return False
+    return token_needs_refresh(credentials_from_token_info(token_info, SCOPES))
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def _download_csv_cached(_session: requests.Session, csv_url: str) -> bytes:
+    """Download a public CSV export, cached across reruns and sessions."""
+    response = _session.get(csv_url, timeout=30)
+    response.raise_for_status()
+    
+    if response.content[:1024].lstrip().startswith(b'<!DOCTYPE html>'):
+        raise ValueError("Sheet may not be publicly accessible. Received HTML instead of CSV.")
+    return response.content
+
+def _session_token_fingerprint() -> Optional[str]:
+    """Hash the signed-in user's OAuth token so cached API results are scoped to that user."""
+    token_info = st.session_state.get("sheets_token_info")
+    return token_fingerprint(token_info) if token_info else None
+
+@st.cache_resource(ttl=CLIENT_CACHE_TTL, max_entries=CLIENT_CACHE_ENTRIES, show_spinner=False)
+def _build_authorized_session(token_hash: Optional[str], _token_info: Dict) -> AuthorizedSession:
+    """Create a pooled, self-refreshing HTTP session for direct Sheets REST calls, once per token."""
+    creds = credentials_from_token_info(_token_info, SCOPES)
+    session = AuthorizedSession(creds)
+    # Keep-alive connections are reused across calls and reruns instead of a new TLS handshake each time
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+    return session
 
 def authenticate_google_sheets_oauth():
     """Authenticate with Google Sheets API using Streamlit interface - FIXED VERSION"""
@@ -34,37 +122,20 @@ def authenticate_google_sheets_oauth():
     # Check for existing token in session state
     if "sheets_token_info" in st.session_state:
         try:
-            creds = Credentials.from_authorized_user_info(
+            creds = credentials_from_token_info(
                 st.session_state.sheets_token_info, SCOPES)
+            creds = ensure_fresh(creds)
             if creds and creds.valid:
-                return build("sheets", "v4", credentials=creds)
-            elif creds and creds.expired and creds.refresh_token:
-                st.info("Refreshing Google Sheets credentials...")
-                creds.refresh(Request())
-                st.session_state.sheets_token_info = json.loads(creds.to_json())
-                return build("sheets", "v4", credentials=creds)
+                return build_sheets_service(_session_token_fingerprint(), st.session_state.sheets_token_info)
         except Exception as e:
             st.error(f"Failed to use cached token: {str(e)}")
             if "sheets_token_info" in st.session_state:
                 del st.session_state["sheets_token_info"]
 
-    # Load credentials from credentials.json first, then st.secrets
-    creds_data = None
-    if os.path.exists(CREDENTIALS_FILE):
-        try:
-            with open(CREDENTIALS_FILE, 'r') as f:
-                creds_data = json.load(f)
-        except json.JSONDecodeError:
-            st.error(f"Error: {CREDENTIALS_FILE} is not a valid JSON file. Please check its content.")
-            return None
-    elif "google" in st.secrets and "credentials_json" in st.secrets["google"]:
-        try:
-            creds_data = json.loads(st.secrets["google"]["credentials_json"])
-        except json.JSONDecodeError:
-            st.error("Error: st.secrets['google']['credentials_json'] is not a valid JSON string.")
-            return None
-    else:
-        st.error(f"Google credentials missing. Please provide '{CREDENTIALS_FILE}' in the app directory or configure st.secrets['google']['credentials_json'].")
+    try:
+        creds_data = load_oauth_client_config()
+    except ValueError as e:
+        st.error(str(e))
         return None
 
     # Check for callback code from OAuth redirect
@@ -95,6 +166,8 @@ def authenticate_google_sheets_oauth():
 
             # Save credentials in session state
             st.session_state.sheets_token_info = json.loads(creds.to_json())
+            # Google only issues a refresh token on consent; without one, ask for consent next time
+            st.session_state.sheets_needs_consent = not creds.refresh_token
             
             # Clear the code and state from URL and session
             st.query_params.clear()
@@ -119,9 +192,9 @@ def authenticate_google_sheets_oauth():
         redirect_uri=redirect_uri
     )
 
-    # Generate authorization URL with state parameter
+    # Generate authorization URL with state parameter; returning users only pick their account
     auth_url, state = flow.authorization_url(
-        prompt='consent',
+        prompt='consent' if st.session_state.get("sheets_needs_consent") else 'select_account',
         access_type='offline',
         include_granted_scopes='true')
 
@@ -149,25 +222,275 @@ def authenticate_google_sheets_oauth():
 
     return None
 
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+@with_backoff
+def _get_sheet_info_cached(_service, sheet_id: str, token_hash: Optional[str]) -> List[Dict]:
+    """Fetch the list of sheets in a spreadsheet via the Sheets API, cached across reruns."""
+    spreadsheet_metadata = _service.spreadsheets().get(
+        spreadsheetId=sheet_id,
+        fields='sheets(properties(sheetId,title))'
+    ).execute()
+    
+    sheets_info = []
+    for sheet in spreadsheet_metadata.get('sheets', []):
+        prop = sheet.get('properties', {})
+        sheets_info.append({
+            "gid": str(prop.get('sheetId')),
+            "name": prop.get('title')
+        })
+    return sheets_info
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+@with_backoff
+def _get_values_cached(_session: AuthorizedSession, sheet_id: str, range_name: str, token_hash: Optional[str],
+                       value_render_option: str = 'FORMATTED_VALUE',
+                       date_time_render_option: str = 'FORMATTED_STRING') -> List[List]:
+    """Fetch the raw row values of a single range from the Sheets REST API, cached across reruns."""
+    url = f"{SHEETS_API_URL}/spreadsheets/{sheet_id}/values/{quote(range_name, safe='')}"
+    params = {
+        'majorDimension': 'ROWS',
+        'valueRenderOption': value_render_option,
+        'dateTimeRenderOption': date_time_render_option
+    }
+    response = _session.get(url, params=params, timeout=30)
+    if response.status_code >= 400:
+        # Surface failures the same way as the googleapiclient calls
+        raise HttpError(httplib2.Response({'status': response.status_code}), response.content, uri=url)
+    return response.json().get('values', [])
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def _batch_get_values_cached(_service, sheet_id: str, ranges: tuple, token_hash: Optional[str],
+                             value_render_option: str = 'FORMATTED_VALUE',
+                             date_time_render_option: str = 'FORMATTED_STRING') -> List[Dict]:
+    """Fetch several ranges in one batchGet request via the Sheets API, cached across reruns."""
+    return batch_get_values(_service, sheet_id, ranges, value_render_option=value_render_option,
+                            date_time_render_option=date_time_render_option)
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+@with_backoff
+def _get_date_columns_cached(_service, sheet_id: str, sheet_names: tuple, header_rows: tuple,
+                             token_hash: Optional[str]) -> Dict[str, List[int]]:
+    """Find the columns formatted as dates in each sheet, from the rows just below its header."""
+    ranges = [
+        f"{_quote_sheet_name(name)}!{header_row + 1}:{header_row + DATE_SAMPLE_ROWS}"
+        for name, header_row in zip(sheet_names, header_rows)
+    ]
+    # Only the number format type of each cell is requested, so the response stays small
+    response = _service.spreadsheets().get(
+        spreadsheetId=sheet_id,
+        ranges=ranges,
+        fields='sheets(properties(title),data(startColumn,rowData(values(effectiveFormat(numberFormat(type))))))'
+    ).execute()
+    
+    date_columns = {}
+    for sheet in response.get('sheets', []):
+        columns = set()
+        for grid in sheet.get('data', []):
+            start = grid.get('startColumn', 0)
+            for row in grid.get('rowData', []):
+                for j, cell in enumerate(row.get('values', [])):
+                    if cell.get('effectiveFormat', {}).get('numberFormat', {}).get('type') in DATE_NUMBER_FORMATS:
+                        columns.add(start + j)
+        date_columns[sheet['properties']['title']] = sorted(columns)
+    return date_columns
+
+def extract_sheet_gid(url: str) -> Optional[str]:
+    """Extract the sheet gid from a Google Sheets URL, or None if the URL doesn't name a sheet."""
+    match = _SHEET_GID_RE.search(url)
+    return match.group(1) if match else None
+
+def _find_sheet_matches(text: str, complete: bool = True) -> List[tuple]:
+    """
+    Return (key, name, gid) for every sheet reference found in part of a public spreadsheet page.
+    When complete is False more of the page follows, so matches running up to the end of text are
+    skipped: a sheetId there may be cut off mid-number.
+    """
+    limit = len(text) if complete else len(text) - 1
+    # Scan once for all "<key>":"<name>","sheetId":<gid> variants
+    matches = [m.groups() for m in _SHEET_NAME_RE.finditer(text) if m.end() <= limit]
+    matches.extend(
+        ('properties', m.group(2), m.group(1)) for m in _SHEET_PROPS_RE.finditer(text) if m.end() <= limit)
+    return matches
+
+def _select_sheet_info(matches) -> List[Dict]:
+    """Keep only the matches for the most preferred key, as sheet info dicts."""
+    matches_by_key = {key: [] for key in _SHEET_NAME_KEYS}
+    for key, name, gid in matches:
+        matches_by_key[key].append({"gid": str(gid), "name": name})
+    
+    for key in _SHEET_NAME_KEYS:
+        if matches_by_key[key]:
+            return matches_by_key[key]
+    return []
+
+def _scan_sheet_info_stream(response: requests.Response) -> List[Dict]:
+    """
+    Read a streamed public spreadsheet page chunk by chunk, stopping once the sheet list is complete.
+    Sheet metadata sits near the top of the page, so reading stops after PAGE_IDLE_CHUNKS
+    consecutive chunks add no new sheets instead of downloading the whole page.
+    """
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    
+    found = {}  # (key, gid) -> name, in page order
+    
+    def add_matches(text: str, complete: bool) -> bool:
+        new_sheets = False
+        for key, name, gid in _find_sheet_matches(text, complete):
+            if (key, gid) not in found:
+                found[(key, gid)] = name
+                new_sheets = True
+        return new_sheets
+    
+    window = ''
+    idle_chunks = 0
+    for chunk in response.iter_content(chunk_size=PAGE_CHUNK_SIZE, decode_unicode=True):
+        # Keep the end of the previous chunk so matches split across chunks are still found
+        window = window[-PAGE_CHUNK_OVERLAP:] + chunk
+        
+        if add_matches(window, complete=False):
+            idle_chunks = 0
+        elif found:
+            idle_chunks += 1
+            if idle_chunks >= PAGE_IDLE_CHUNKS:
+                break
+    else:
+        # The page ended; a match at its very end was held back above and is complete now
+        add_matches(window, complete=True)
+    
+    return _select_sheet_info((key, name, gid) for (key, gid), name in found.items())
+
+def _dedupe_headers(headers: List) -> List[str]:
+    """Name blank headers Column_N and suffix repeated headers with _1, _2, ..."""
+    header_series = pd.Series(headers, dtype=object)
+    blank = header_series.isna() | (header_series.astype(str).str.strip() == '')
+    header_series = header_series.astype(str)
+    header_series[blank] = [f'Column_{i+1}' for i in np.flatnonzero(blank.to_numpy())]
+    
+    # Leave the first occurrence of each header untouched, number the rest
+    counts = header_series.groupby(header_series, sort=False).cumcount()
+    return header_series.where(counts == 0, header_series + '_' + counts.astype(str)).tolist()
+
+def _source_labels(name: str, n_rows: int) -> pd.Categorical:
+    """Label every row with its source sheet as a single-category categorical."""
+    return pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[name])
+
+@dataclass(slots=True)
+class SheetEntry:
+    """A sheet added to the combiner, with its fetched data."""
+    id: str
+    gid: str
+    name: str
+    display_name: str
+    data: pd.DataFrame
+    header_row: int
+    n_rows: int = field(init=False)
+    n_cols: int = field(init=False)
+    preview: pd.DataFrame = field(init=False)
+    
+    def __post_init__(self):
+        # Computed once at add time so reruns don't touch the full DataFrame
+        self.n_rows = len(self.data)
+        self.n_cols = len(self.data.columns)
+        self.preview = self.data.head(10)
+
+def _arrow_field_type(dtypes: List) -> pa.DataType:
+    """Pick a single Arrow type for a column from its pandas dtypes across sheets."""
+    if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+        return pa.dictionary(pa.int32(), pa.string())
+    if all(pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        return pa.bool_()
+    if all(pd.api.types.is_datetime64_dtype(dtype) for dtype in dtypes):
+        return pa.timestamp('ns')
+    if all(pd.api.types.is_integer_dtype(dtype) for dtype in dtypes):
+        return pa.int64()
+    if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        return pa.float64()
+    return pa.string()
+
+def _to_arrow_array(column: Optional[pd.Series], arrow_type: pa.DataType, n_rows: int) -> pa.Array:
+    """Convert one sheet's column to arrow_type, or a column of nulls if the sheet doesn't have it."""
+    if column is None:
+        return pa.nulls(n_rows, arrow_type)
+    # Typed values can mix numbers, booleans and text in one column; write that column as text.
+    # Arrow would quietly turn a float/bool mix into doubles, so mixed columns are caught up front
+    if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) in ('mixed', 'mixed-integer'):
+        return pa.Array.from_pandas(column.astype(str).mask(column.isna())).cast(arrow_type)
+    try:
+        array = pa.Array.from_pandas(column)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        array = pa.Array.from_pandas(column.astype(str).mask(column.isna()))
+    return array.cast(arrow_type)
+
+def _unified_arrow_schema(frames: List[pd.DataFrame]) -> pa.Schema:
+    """Build one Arrow schema covering every sheet, in pd.concat column order (first appearance)."""
+    columns = list(dict.fromkeys(col for df in frames for col in df.columns))
+    return pa.schema([
+        pa.field(col, _arrow_field_type([df[col].dtype for df in frames if col in df.columns]))
+        for col in columns
+    ])
+
+def _arrow_types_mapper(arrow_type: pa.DataType):
+    """Keep Arrow columns as ArrowDtype, except dictionaries which convert to pandas categoricals."""
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
 # --- GoogleSheetsCombiner Class ---
 class GoogleSheetsCombiner:
     def __init__(self):
-        self.sheets_data = []
+        self.sheets_data: List[SheetEntry] = []
         self.combined_data = pd.DataFrame()
+        self.combined_table: Optional[pa.Table] = None  # Arrow buffers behind combined_data
         self.sheets_service = None 
+        self.typed_values = False
+        self._data_cache = OrderedDict()  # key -> (fetched_at, DataFrame), least recently used first
+        # Version-keyed caches are shared by every session, so the key also carries an ID unique to this combiner
+        self._uid = uuid.uuid4().hex
+        self._version = 0
+        self._session = _create_http_session()
         
+    def _bump_version(self):
+        """Mark the sheets or combined data as changed, invalidating version-keyed caches."""
+        self._version += 1
+
+    @property
+    def cache_key(self) -> tuple:
+        """Identify this combiner's current sheets and combined data across all sessions."""
+        return (self._uid, self._version)
+
     def set_sheets_service(self, service):
         self.sheets_service = service
 
+    def set_typed_values(self, enabled: bool):
+        """Fetch unformatted API values (numbers as numbers) instead of display strings."""
+        self.typed_values = enabled
+
+    @property
+    def value_render_option(self) -> str:
+        """valueRenderOption to send with Sheets API value requests."""
+        return 'UNFORMATTED_VALUE' if self.typed_values else 'FORMATTED_VALUE'
+
+    @property
+    def date_time_render_option(self) -> str:
+        """dateTimeRenderOption to send with Sheets API value requests."""
+        # Serial numbers skip server-side date formatting; _date_columns says which columns to convert back
+        return 'SERIAL_NUMBER' if self.typed_values else 'FORMATTED_STRING'
+
+    def _date_columns(self, sheet_id: str, sheet_names: List[str], header_rows: List[int]) -> Dict[str, List[int]]:
+        """Map each sheet name to its date-formatted column indexes when fetching typed values."""
+        if not self.typed_values:
+            return {}
+        try:
+            return _get_date_columns_cached(
+                self.sheets_service, sheet_id, tuple(sheet_names), tuple(header_rows), _session_token_fingerprint())
+        except Exception as e:
+            st.warning(f"⚠️ Couldn't read date formats, dates will show as serial numbers: {str(e)}")
+            return {}
+
     def extract_sheet_id(self, url: str) -> str:
         """Extract Google Sheet ID from URL."""
-        pattern = r'/spreadsheets/d/([a-zA-Z0-9-_]+)'
-        match = re.search(pattern, url)
-        
-        if not match:
-            raise ValueError(f"Invalid Google Sheets URL format: {url}")
-        
-        return match.group(1)
+        return extract_sheet_id(url)
     
     def get_sheet_info(self, sheet_id: str) -> List[Dict]:
         """Get information about all sheets in a Google Sheets document."""
@@ -176,17 +499,7 @@ class GoogleSheetsCombiner:
         # Try Google Sheets API first if authenticated
         if self.sheets_service:
             try:
-                spreadsheet_metadata = self.sheets_service.spreadsheets().get(
-                    spreadsheetId=sheet_id,
-                    fields='sheets.properties'
-                ).execute()
-                
-                for sheet in spreadsheet_metadata.get('sheets', []):
-                    prop = sheet.get('properties', {})
-                    sheets_info.append({
-                        "gid": str(prop.get('sheetId')),
-                        "name": prop.get('title')
-                    })
+                sheets_info = _get_sheet_info_cached(self.sheets_service, sheet_id, _session_token_fingerprint())
                 
                 if sheets_info:
                     st.success(f"✅ Found {len(sheets_info)} sheets using Google Sheets API")
@@ -214,29 +527,9 @@ class GoogleSheetsCombiner:
         if not self.sheets_service:
             try:
                 url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/edit"
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                
-                # Try multiple patterns to extract sheet information
-                patterns = [
-                    r'"sheetName":"([^"]+)","sheetId":(\d+)',
-                    r'"title":"([^"]+)","sheetId":(\d+)',
-                    r'"name":"([^"]+)","sheetId":(\d+)',
-                    r'{"properties":{"sheetId":(\d+),"title":"([^"]+)"'
-                ]
-                
-                for pattern in patterns:
-                    if pattern == r'{"properties":{"sheetId":(\d+),"title":"([^"]+)"':
-                        matches = re.findall(pattern, response.text)
-                        for gid, name in matches:
-                            sheets_info.append({"gid": str(gid), "name": name})
-                    else:
-                        matches = re.findall(pattern, response.text)
-                        for name, gid in matches:
-                            sheets_info.append({"gid": str(gid), "name": name})
-                    
-                    if sheets_info:
-                        break
+                with self._session.get(url, timeout=10, stream=True) as response:
+                    response.raise_for_status()
+                    sheets_info = _scan_sheet_info_stream(response)
                 
                 if sheets_info:
                     st.success(f"✅ Found {len(sheets_info)} sheets using public URL parsing")
@@ -259,65 +552,102 @@ class GoogleSheetsCombiner:
         st.error("❌ Unable to access this sheet. Please check authentication and permissions.")
         return []
         
+    def _values_to_dataframe(self, values: List[List], sheet_id: str, sheet_name: str = None, gid: str = "0", header_row: int = 1,
+                             date_columns: List[int] = ()) -> pd.DataFrame:
+        """Build a DataFrame from the raw row values returned by the Sheets API."""
+        if not values:
+            st.warning(f"⚠️ Sheet '{sheet_name or 'Sheet1'}' is empty.")
+            return pd.DataFrame()
+        
+        # Pad ragged rows into a rectangular object array in one allocation
+        max_cols = max(map(len, values))
+        padded_values = np.full((len(values), max_cols), '', dtype=object)
+        for i, row in enumerate(values):
+            padded_values[i, :len(row)] = row
+        
+        # Use specified header row (convert to 0-indexed)
+        header_idx = header_row - 1
+        if header_idx >= len(padded_values):
+            st.error(f"Header row {header_row} is beyond the data range. Using row 1 instead.")
+            header_idx = 0
+        
+        headers = padded_values[header_idx].tolist()
+        
+        # Handle empty or duplicate headers
+        unique_headers = _dedupe_headers(headers)
+        
+        # Use data starting from the row after headers
+        df = pd.DataFrame(padded_values[header_idx + 1:], columns=unique_headers)
+        if self.typed_values:
+            # Unformatted values arrive as native numbers/booleans; treat blanks as missing so columns can be typed
+            df = df.mask(df == '').infer_objects()
+            for j in date_columns:
+                if j >= df.shape[1]:
+                    continue
+                column = df.iloc[:, j]
+                # Date-formatted columns holding text are left alone
+                if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+                    try:
+                        df.isetitem(j, pd.to_datetime(column, unit='D', origin=SERIAL_DATE_ORIGIN))
+                    except (pd.errors.OutOfBoundsDatetime, OverflowError):
+                        # Dates past 2262 (e.g. a 9999-12-31 placeholder) don't fit; keep the column as serial numbers
+                        pass
+        df['_source_sheet'] = _source_labels(sheet_name or f"Sheet_{sheet_id}_gid{gid}", len(df))
+        
+        return df
+
+    def _data_cache_key(self, sheet_id: str, sheet_name: str, gid: str, header_row: int) -> tuple:
+        return (sheet_id, gid, sheet_name, header_row, self.value_render_option, _session_token_fingerprint())
+
+    def _get_cached_data(self, key: tuple) -> Optional[pd.DataFrame]:
+        """Return a recently fetched DataFrame for key, or None if missing or older than DATA_CACHE_TTL."""
+        entry = self._data_cache.get(key)
+        if entry is None:
+            return None
+        fetched_at, df = entry
+        if time.monotonic() - fetched_at > DATA_CACHE_TTL:
+            del self._data_cache[key]
+            return None
+        self._data_cache.move_to_end(key)
+        return df
+
+    def _put_cached_data(self, key: tuple, df: pd.DataFrame):
+        """Remember a fetched DataFrame, evicting the least recently used beyond DATA_CACHE_SIZE."""
+        if df is None or df.empty:
+            return
+        self._data_cache[key] = (time.monotonic(), df)
+        self._data_cache.move_to_end(key)
+        while len(self._data_cache) > DATA_CACHE_SIZE:
+            self._data_cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Forget all fetched sheet data so the next fetch goes to Google again."""
+        self._data_cache.clear()
+
     def fetch_sheet_data(self, sheet_id: str, sheet_name: str = None, gid: str = "0", header_row: int = 1) -> pd.DataFrame:
         """
         Fetch sheet data, prioritizing Google Sheets API if authenticated.
         Always returns a pandas DataFrame (empty if no data or error).
         """
+        key = self._data_cache_key(sheet_id, sheet_name, gid, header_row)
+        df = self._get_cached_data(key)
+        if df is None:
+            df = self._fetch_sheet_data_uncached(sheet_id, sheet_name, gid, header_row)
+            self._put_cached_data(key, df)
+        return df
+
+    def _fetch_sheet_data_uncached(self, sheet_id: str, sheet_name: str = None, gid: str = "0", header_row: int = 1) -> pd.DataFrame:
         if self.sheets_service:
             try:
                 # Get all data from the sheet using A1 notation
-                range_name = f"'{sheet_name}'" if sheet_name else "Sheet1"
+                range_name = _quote_sheet_name(sheet_name) if sheet_name else "Sheet1"
                 
-                result = self.sheets_service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id,
-                    range=range_name,
-                    majorDimension='ROWS'
-                ).execute()
-                
-                values = result.get('values', [])
-                if not values:
-                    st.warning(f"⚠️ Sheet '{sheet_name or 'Sheet1'}' is empty.")
-                    return pd.DataFrame()
-                
-                # Create DataFrame with proper handling of varying row lengths
-                max_cols = max(len(row) for row in values) if values else 0
-                
-                # Pad all rows to have the same length
-                padded_values = []
-                for row in values:
-                    padded_row = row + [''] * (max_cols - len(row))
-                    padded_values.append(padded_row)
-                
-                # Use specified header row (convert to 0-indexed)
-                header_idx = header_row - 1
-                if header_idx >= len(padded_values):
-                    st.error(f"Header row {header_row} is beyond the data range. Using row 1 instead.")
-                    header_idx = 0
-                
-                headers = padded_values[header_idx] if header_idx < len(padded_values) else []
-                
-                # Handle empty or duplicate headers
-                unique_headers = []
-                header_count = {}
-                for i, header in enumerate(headers):
-                    if not header or header.strip() == '':
-                        header = f'Column_{i+1}'
-                    if header in header_count:
-                        header_count[header] += 1
-                        unique_headers.append(f"{header}_{header_count[header]}")
-                    else:
-                        header_count[header] = 0
-                        unique_headers.append(header)
-                
-                # Use data starting from the row after headers
-                data_start_idx = header_idx + 1
-                data = padded_values[data_start_idx:] if data_start_idx < len(padded_values) else []
-                
-                df = pd.DataFrame(data, columns=unique_headers)
-                df['_source_sheet'] = sheet_name or f"Sheet_{sheet_id}_gid{gid}"
-                
-                return df
+                session = _build_authorized_session(_session_token_fingerprint(), st.session_state.sheets_token_info)
+                values = _get_values_cached(session, sheet_id, range_name, _session_token_fingerprint(),
+                                            self.value_render_option, self.date_time_render_option)
+                date_columns = self._date_columns(sheet_id, [sheet_name or 'Sheet1'], [header_row])
+                return self._values_to_dataframe(values, sheet_id, sheet_name, gid, header_row,
+                                                 date_columns.get(sheet_name or 'Sheet1', ()))
                 
             except HttpError as err:
                 if err.resp.status == 403:
@@ -333,87 +663,220 @@ class GoogleSheetsCombiner:
         
         # Fallback to public CSV export
         if not self.sheets_service:
-            csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-            
-            try:
-                response = requests.get(csv_url, timeout=30)
-                response.raise_for_status()
-                
-                if response.text.strip().startswith('<!DOCTYPE html>'):
-                    raise ValueError("Sheet may not be publicly accessible. Received HTML instead of CSV.")
-                
-                df = pd.read_csv(io.StringIO(response.text), header=header_row-1)
-                
-                # Ensure unique column names
-                unique_headers = []
-                header_count = {}
-                for i, header in enumerate(df.columns):
-                    header_str = str(header) if pd.notnull(header) else f'Column_{i+1}'
-                    if header_str in header_count:
-                        header_count[header_str] += 1
-                        unique_headers.append(f"{header_str}_{header_count[header_str]}")
-                    else:
-                        header_count[header_str] = 0
-                        unique_headers.append(header_str)
-                
-                df.columns = unique_headers
-                df['_source_sheet'] = sheet_name or f"Sheet_{sheet_id}_gid{gid}"
-                
-                return df
-                
-            except requests.exceptions.RequestException as e:
-                if "401" in str(e) or "Unauthorized" in str(e):
-                    st.error(f"❌ Sheet '{sheet_name or 'Sheet1'}' is private and requires authentication.")
-                    st.info("💡 Please use the 'Connect to Google Sheets' button to authenticate.")
-                else:
-                    st.error(f"❌ Failed to fetch sheet data: {str(e)}")
-                return pd.DataFrame()
-            except pd.errors.EmptyDataError:
-                st.warning(f"⚠️ Sheet '{sheet_name or 'Sheet1'}' is empty.")
-                return pd.DataFrame()
-            except Exception as e:
-                st.error(f"❌ Error processing sheet '{sheet_name or 'Sheet1'}': {str(e)}")
-                return pd.DataFrame()
+            return self._fetch_csv(sheet_id, gid, sheet_name, header_row)
         
         st.error(f"❌ Unable to fetch data for sheet '{sheet_name or 'Sheet1'}'.")
         return pd.DataFrame()
 
-    def add_sheet(self, sheet_id: str, sheet_info: Dict, header_row: int = 1, custom_name: str = None) -> bool:
-        """Add a single sheet to internal state."""
-        sheet_name = sheet_info['name']
-        gid = sheet_info['gid']
+    def _fetch_csv(self, sheet_id: str, gid: str = "0", sheet_name: str = None, header_row: int = 1) -> pd.DataFrame:
+        """Fetch a publicly shared sheet through the CSV export endpoint."""
+        csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+        
+        try:
+            content = _download_csv_cached(self._session, csv_url)
+            
+            # Read every cell as a string like the API path, skipping type inference and NA scanning
+            df = pd.read_csv(
+                io.BytesIO(content),
+                header=header_row-1,
+                dtype=str,
+                keep_default_na=False,
+                na_filter=False,
+                engine='c',
+                low_memory=False
+            )
+            
+            # Ensure unique column names
+            df.columns = _dedupe_headers(list(df.columns))
+            df['_source_sheet'] = _source_labels(sheet_name or f"Sheet_{sheet_id}_gid{gid}", len(df))
+            
+            return df
+            
+        except requests.exceptions.RequestException as e:
+            if "401" in str(e) or "Unauthorized" in str(e):
+                st.error(f"❌ Sheet '{sheet_name or 'Sheet1'}' is private and requires authentication.")
+                st.info("💡 Please use the 'Connect to Google Sheets' button to authenticate.")
+            else:
+                st.error(f"❌ Failed to fetch sheet data: {str(e)}")
+            return pd.DataFrame()
+        except pd.errors.EmptyDataError:
+            st.warning(f"⚠️ Sheet '{sheet_name or 'Sheet1'}' is empty.")
+            return pd.DataFrame()
+        except Exception as e:
+            st.error(f"❌ Error processing sheet '{sheet_name or 'Sheet1'}': {str(e)}")
+            return pd.DataFrame()
+
+    def fetch_all(self, sheet_id: str, sheet_infos: List[Dict], header_rows: List[int]) -> List[pd.DataFrame]:
+        """
+        Fetch several sheets of one spreadsheet with a single batchGet request (a single sheet
+        with one values.get request), or with parallel CSV exports when not authenticated.
+        Sheets fetched recently are served from memory and left out of the request.
+        Returns one DataFrame per entry in sheet_infos (empty if no data or error).
+        """
+        keys = [
+            self._data_cache_key(sheet_id, info['name'], info['gid'], header_row)
+            for info, header_row in zip(sheet_infos, header_rows)
+        ]
+        frames = [self._get_cached_data(key) for key in keys]
+        
+        missing = [i for i, df in enumerate(frames) if df is None]
+        if missing:
+            fetched = self._fetch_all_uncached(
+                sheet_id, [sheet_infos[i] for i in missing], [header_rows[i] for i in missing])
+            for i, df in zip(missing, fetched):
+                self._put_cached_data(keys[i], df)
+                frames[i] = df
+        return frames
+
+    def _fetch_all_uncached(self, sheet_id: str, sheet_infos: List[Dict], header_rows: List[int]) -> List[pd.DataFrame]:
+        if not self.sheets_service:
+            # No batch endpoint for public sheets; run the CSV exports concurrently instead
+            frames = [pd.DataFrame() for _ in sheet_infos]
+            with ThreadPoolExecutor(
+                max_workers=CSV_FETCH_WORKERS,
+                initializer=add_script_run_ctx,
+                initargs=(None, get_script_run_ctx())
+            ) as executor:
+                futures = {
+                    executor.submit(self._fetch_csv, sheet_id, info['gid'], info['name'], header_row): i
+                    for i, (info, header_row) in enumerate(zip(sheet_infos, header_rows))
+                }
+                for future in as_completed(futures):
+                    frames[futures[future]] = future.result()
+            return frames
+        
+        if len(sheet_infos) == 1:
+            # A single range goes over the pooled AuthorizedSession, reusing its keep-alive connections
+            info = sheet_infos[0]
+            return [self._fetch_sheet_data_uncached(sheet_id, info['name'], info['gid'], header_rows[0])]
+        
+        ranges = tuple(_quote_sheet_name(info['name']) for info in sheet_infos)
         
         try:
-            df = self.fetch_sheet_data(sheet_id=sheet_id, sheet_name=sheet_name, gid=gid, header_row=header_row)
+            value_ranges = _batch_get_values_cached(
+                self.sheets_service, sheet_id, ranges, _session_token_fingerprint(),
+                self.value_render_option, self.date_time_render_option)
+            
+        except HttpError as err:
+            if err.resp.status == 403:
+                st.error("❌ Access denied to this spreadsheet. Please check your permissions.")
+            elif err.resp.status in (400, 404):
+                st.error("❌ One or more sheets were not found.")
+            else:
+                st.error(f"❌ API Error: HTTP {err.resp.status}")
+            return [pd.DataFrame() for _ in sheet_infos]
+        except Exception as e:
+            st.error(f"❌ Error fetching sheets: {str(e)}")
+            return [pd.DataFrame() for _ in sheet_infos]
+        
+        date_columns = self._date_columns(sheet_id, [info['name'] for info in sheet_infos], header_rows)
+        
+        frames = []
+        for i, (info, header_row) in enumerate(zip(sheet_infos, header_rows)):
+            values = value_ranges[i].get('values', []) if i < len(value_ranges) else []
+            frames.append(self._values_to_dataframe(values, sheet_id, info['name'], info['gid'], header_row,
+                                                    date_columns.get(info['name'], ())))
+        return frames
+
+    def add_sheets(self, sheet_id: str, sheet_infos: List[Dict], header_rows: List[int], custom_names: List[Optional[str]] = None) -> int:
+        """Add several sheets of one spreadsheet to internal state. Returns the number of sheets added."""
+        if custom_names is None:
+            custom_names = [None] * len(sheet_infos)
+        
+        try:
+            frames = self.fetch_all(sheet_id, sheet_infos, header_rows)
+        except Exception as e:
+            st.error(f"❌ Error adding sheets: {str(e)}")
+            return 0
+        
+        added = 0
+        for sheet_info, header_row, custom_name, df in zip(sheet_infos, header_rows, custom_names, frames):
+            sheet_name = sheet_info['name']
             if df is not None and not df.empty:
                 # Use custom name if provided, otherwise use original sheet name
                 display_name = custom_name if custom_name else sheet_name
                 
-                self.sheets_data.append({
-                    "id": sheet_id,
-                    "gid": gid,
-                    "name": sheet_name,
-                    "display_name": display_name,
-                    "data": df,
-                    "header_row": header_row
-                })
-                return True
+                self.sheets_data.append(SheetEntry(
+                    id=sheet_id,
+                    gid=sheet_info['gid'],
+                    name=sheet_name,
+                    display_name=display_name,
+                    data=df,
+                    header_row=header_row
+                ))
+                added += 1
             else:
                 st.warning(f"⚠️ Sheet '{sheet_name}' is empty or inaccessible.")
-                return False
-        except Exception as e:
-            st.error(f"❌ Error adding sheet '{sheet_name}': {str(e)}")
-            return False
+        
+        if added:
+            self._bump_version()
+        return added
+
+    def add_sheets_from_urls(self, urls: List[str], header_row: int = 1) -> tuple:
+        """
+        Add the sheets linked by several URLs, grouped so each spreadsheet is fetched in one request.
+        URLs without a gid add the spreadsheet's first sheet.
+        Returns (sheets added, sheets requested).
+        """
+        # sheet_id -> {gid or None: True}, keeping the order the URLs were given in
+        requested = OrderedDict()
+        for url in urls:
+            requested.setdefault(self.extract_sheet_id(url), OrderedDict())[extract_sheet_gid(url)] = True
+        
+        added = total = 0
+        for sheet_id, gids in requested.items():
+            sheets_info = self.get_sheet_info(sheet_id)
+            infos_by_gid = {info['gid']: info for info in sheets_info}
+            
+            sheet_infos = {}
+            for gid in gids:
+                info = infos_by_gid.get(gid) if gid is not None else next(iter(sheets_info), None)
+                if info is None:
+                    st.warning(f"⚠️ Sheet gid={gid} not found in spreadsheet {sheet_id}.")
+                    total += 1
+                else:
+                    sheet_infos[info['gid']] = info
+            
+            total += len(sheet_infos)
+            if sheet_infos:
+                added += self.add_sheets(sheet_id, list(sheet_infos.values()), [header_row] * len(sheet_infos))
+        return added, total
+
+    def add_sheet(self, sheet_id: str, sheet_info: Dict, header_row: int = 1, custom_name: str = None) -> bool:
+        """Add a single sheet to internal state."""
+        return self.add_sheets(sheet_id, [sheet_info], [header_row], [custom_name]) == 1
 
     def combine_sheets(self) -> pd.DataFrame:
         """Combine all added sheets into a single DataFrame."""
         if not self.sheets_data:
             raise ValueError("No sheets added yet.")
         
-        combined = pd.concat([sheet["data"] for sheet in self.sheets_data], ignore_index=True)
+        frames = [sheet.data for sheet in self.sheets_data]
+        total_rows = sum(len(df) for df in frames)
+        
+        # Build column -> one array per sheet, so each column is converted once per sheet and its chunks
+        # are stitched together without copying; the ArrowDtype-backed result wraps those buffers as-is
+        schema = _unified_arrow_schema(frames)
+        columns = {
+            field.name: pa.chunked_array(
+                [_to_arrow_array(df.get(field.name), field.type, len(df)) for df in frames], type=field.type)
+            for field in schema
+        }
+        table = pa.table(columns, schema=schema)
+        combined = table.to_pandas(types_mapper=_arrow_types_mapper)
+        
+        assert len(combined) == total_rows
+        self.combined_table = table
         self.combined_data = combined
+        self._bump_version()
         return self.combined_data
 
+    def remove_sheet(self, index: int) -> SheetEntry:
+        """Remove an added sheet by position and return it."""
+        sheet = self.sheets_data.pop(index)
+        self._bump_version()
+        return sheet
+
     def get_summary(self) -> Dict:
         """Return a summary of the combined data."""
         try:
@@ -424,9 +887,9 @@ class GoogleSheetsCombiner:
             sheet_stats = []
             for sheet in self.sheets_data:
                 sheet_stats.append({
-                    "name": sheet["display_name"],
-                    "rows": len(sheet["data"]),
-                    "header_row": sheet["header_row"]
+                    "name": sheet.display_name,
+                    "rows": sheet.n_rows,
+                    "header_row": sheet.header_row
                 })
 
             return {
@@ -451,6 +914,190 @@ if 'auth_initiated' not in st.session_state:
     st.session_state.auth_initiated = False
 if 'show_advanced_options' not in st.session_state:
     st.session_state.show_advanced_options = False
+if 'prepared_export' not in st.session_state:
+    st.session_state.prepared_export = None
+if 'default_filename' not in st.session_state:
+    st.session_state.default_filename = f"combined_sheets_{datetime.now():%Y%m%d_%H%M%S}"
+
+@st.cache_data(max_entries=EXPORT_CACHE_ENTRIES, ttl=EXPORT_CACHE_TTL, show_spinner=False)
+def _to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to CSV once per distinct DataFrame, reused across reruns."""
+    # Encode straight into a bytes buffer, CSV_CHUNK_ROWS rows at a time, instead of building one big str
+    output = io.BytesIO()
+    df.to_csv(output, index=False, chunksize=CSV_CHUNK_ROWS)
+    return output.getvalue()
+
+def _remove_files(paths: set):
+    """Delete every file in paths, ignoring ones that are already gone."""
+    for path in list(paths):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        paths.discard(path)
+
+@st.cache_resource(show_spinner=False)
+def _export_temp_files() -> set:
+    """Paths of temp files written by large exports, shared by all sessions and deleted at process exit."""
+    # Created once per process rather than per rerun, so only one exit hook is ever registered
+    paths = set()
+    atexit.register(_remove_files, paths)
+    return paths
+
+def _prune_export_temp_files():
+    """Delete large-export temp files older than EXPORT_TEMPFILE_TTL, such as those left by closed sessions."""
+    paths = _export_temp_files()
+    cutoff = time.time() - EXPORT_TEMPFILE_TTL
+    stale = set()
+    for path in list(paths):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                stale.add(path)
+        except OSError:
+            paths.discard(path)
+    paths -= stale
+    _remove_files(stale)
+
+def _discard_prepared_export():
+    """Forget the prepared download, deleting its temp file if it has one."""
+    path = (st.session_state.prepared_export or {}).get("path")
+    if path:
+        _remove_files({path})
+        _export_temp_files().discard(path)
+    st.session_state.prepared_export = None
+
+def _to_csv_tempfile(df: pd.DataFrame) -> str:
+    """Write a DataFrame to a temp CSV file CSV_CHUNK_ROWS rows at a time and return its path."""
+    _prune_export_temp_files()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as handle:
+        df.to_csv(handle, index=False, chunksize=CSV_CHUNK_ROWS)
+    _export_temp_files().add(handle.name)
+    return handle.name
+
+def _to_parquet_tempfile(table: pa.Table) -> str:
+    """Write a combined Arrow table to a temp Parquet file one sheet at a time and return its path."""
+    _prune_export_temp_files()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as handle:
+        # combine_sheets builds one chunk per sheet, so each record batch is one sheet's rows
+        with pq.ParquetWriter(handle, table.schema) as writer:
+            for batch in table.to_batches():
+                writer.write_batch(batch)
+    _export_temp_files().add(handle.name)
+    return handle.name
+
+@st.cache_data(max_entries=EXPORT_CACHE_ENTRIES, ttl=EXPORT_CACHE_TTL, show_spinner=False)
+def _to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to an Excel workbook once per distinct DataFrame, reused across reruns."""
+    # write_row silently drops cells past the sheet limits, so refuse up front instead of exporting a truncated file
+    n_rows, n_cols = df.shape
+    if n_rows + 1 > XLSX_MAX_ROWS or n_cols > XLSX_MAX_COLS:
+        raise ValueError(
+            f"This sheet is too large for Excel: {n_rows + 1} rows and {n_cols} columns, "
+            f"the limit is {XLSX_MAX_ROWS} rows and {XLSX_MAX_COLS} columns. Export as CSV or Parquet instead.")
+    output = io.BytesIO()
+    # constant_memory streams each row out as soon as the next one starts, so rows must be written
+    # in order; pandas' to_excel emits cells column by column, hence the explicit row loop
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+    })
+    worksheet = workbook.add_worksheet('Combined')
+    worksheet.write_row(0, 0, [str(col) for col in df.columns])
+    for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_idx, 0, [None if pd.isna(value) else value for value in row])
+    workbook.close()
+    return output.getvalue()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_summary(cache_key: tuple, _combiner: GoogleSheetsCombiner) -> Dict:
+    """Summarize the combiner once per cache_key instead of on every rerun."""
+    return _combiner.get_summary()
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "JSON": ("json", "application/json"),
+    "Parquet": ("parquet", "application/octet-stream"),
+}
+
+# Custom CSS for better styling
+_CUSTOM_CSS = """
+<style>
+.main-header {
+    background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
+    padding: 2rem;
+    border-radius: 10px;
+    margin-bottom: 2rem;
+    text-align: center;
+}
+.main-header h1 {
+    color: white;
+    margin: 0;
+    font-size: 2.5rem;
+}
+.main-header p {
+    color: #f0f0f0;
+    margin: 0.5rem 0 0 0;
+    font-size: 1.1rem;
+}
+.metric-container {
+    background: #f8f9fa;
+    padding: 1rem;
+    border-radius: 8px;
+    border-left: 4px solid #667eea;
+    margin: 0.5rem 0;
+}
+.success-box {
+    background: #d4edda;
+    border: 1px solid #c3e6cb;
+    color: #155724;
+    padding: 1rem;
+    border-radius: 8px;
+    margin: 1rem 0;
+}
+.warning-box {
+    background: #fff3cd;
+    border: 1px solid #ffeaa7;
+    color: #856404;
+    padding: 1rem;
+    border-radius: 8px;
+    margin: 1rem 0;
+}
+.info-box {
+    background: #e7f3ff;
+    border: 1px solid #bee5eb;
+    color: #0c5460;
+    padding: 1rem;
+    border-radius: 8px;
+    margin: 1rem 0;
+}
+.sheet-card {
+    background: white;
+    border: 1px solid #e0e0e0;
+    border-radius: 8px;
+    padding: 1rem;
+    margin: 0.5rem 0;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+}
+.stButton > button {
+    border-radius: 8px;
+    border: none;
+    padding: 0.5rem 1rem;
+    font-weight: 500;
+    transition: all 0.3s ease;
+}
+.stButton > button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+}
+.stSelectbox {
+    margin-bottom: 1rem;
+}
+</style>
+"""
 
 def main():
     st.set_page_config(
@@ -461,80 +1108,7 @@ def main():
     )
     
     # Custom CSS for better styling
-    st.markdown("""
-    <style>
-    .main-header {
-        background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-        padding: 2rem;
-        border-radius: 10px;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .main-header h1 {
-        color: white;
-        margin: 0;
-        font-size: 2.5rem;
-    }
-    .main-header p {
-        color: #f0f0f0;
-        margin: 0.5rem 0 0 0;
-        font-size: 1.1rem;
-    }
-    .metric-container {
-        background: #f8f9fa;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #667eea;
-        margin: 0.5rem 0;
-    }
-    .success-box {
-        background: #d4edda;
-        border: 1px solid #c3e6cb;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 1rem 0;
-    }
-    .warning-box {
-        background: #fff3cd;
-        border: 1px solid #ffeaa7;
-        color: #856404;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 1rem 0;
-    }
-    .info-box {
-        background: #e7f3ff;
-        border: 1px solid #bee5eb;
-        color: #0c5460;
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 1rem 0;
-    }
-    .sheet-card {
-        background: white;
-        border: 1px solid #e0e0e0;
-        border-radius: 8px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .stButton > button {
-        border-radius: 8px;
-        border: none;
-        padding: 0.5rem 1rem;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    .stSelectbox {
-        margin-bottom: 1rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
     
     # Header
     st.markdown("""
@@ -550,6 +1124,15 @@ def main():
         
         # Authentication Section
         with st.expander("🔐 Google Authentication", expanded=True):
+            # Sign-ins that only picked an account may not get a refresh token; ask again before the token lapses
+            if st.session_state.google_sheets_service is not None and _token_expired_without_refresh():
+                st.session_state.google_sheets_service = None
+                st.session_state.combiner.set_sheets_service(None)
+                del st.session_state.sheets_token_info
+                st.session_state.sheets_needs_consent = True
+                st.session_state.auth_initiated = True
+                st.warning("⚠️ Your Google session has expired. Please authorize again.")
+            
             if st.session_state.google_sheets_service is None:
                 st.info("Connect to access private sheets")
                 if st.button("🔗 Connect to Google Sheets", type="primary", use_container_width=True):
@@ -575,6 +1158,17 @@ def main():
                     st.info("🔌 Disconnected from Google Sheets API")
                     st.rerun()
         
+        # Data Options Section
+        with st.expander("⚙️ Data Options"):
+            typed_values = st.toggle(
+                "Keep numbers as numbers",
+                key="typed_values",
+                help="Fetch raw cell values through the API so numbers, booleans and dates keep their types. "
+                     "Number formatting such as currency symbols and percentages is dropped. "
+                     "Only applies when connected; public sheets are always read as text."
+            )
+            st.session_state.combiner.set_typed_values(typed_values)
+        
         st.markdown("---")
         
         # Add New Sheet Section
@@ -652,10 +1246,62 @@ def main():
                         st.rerun()
                     else:
                         st.warning(f"⚠️ Failed to add sheet '{selected_sheet}'. It may be empty or inaccessible.")
+                
+                if len(st.session_state.available_sheets_info) > 1:
+                    all_count = len(st.session_state.available_sheets_info)
+                    if st.button(f"➕ Add All ({all_count} sheets)", key="add_all_sheets", type="secondary", use_container_width=True):
+                        with st.spinner("📥 Adding sheets..."):
+                            added = st.session_state.combiner.add_sheets(
+                                sheet_id=st.session_state.combiner.extract_sheet_id(current_sheet_url_input),
+                                sheet_infos=st.session_state.available_sheets_info,
+                                header_rows=[header_row] * all_count
+                            )
+                        
+                        if added:
+                            st.success(f"✅ Successfully added {added} of {all_count} sheets!")
+                            time.sleep(1)
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ No sheets were added. They may be empty or inaccessible.")
 
         elif current_sheet_url_input:
             st.warning("⚠️ No sheets available. This may be a private sheet requiring authentication.")
         
+        # Several URLs at once, fetched one request per spreadsheet
+        with st.expander("📑 Add Multiple URLs"):
+            bulk_urls = st.text_area(
+                "Google Sheets URLs",
+                placeholder="https://docs.google.com/spreadsheets/d/...#gid=0\nhttps://docs.google.com/spreadsheets/d/...#gid=123",
+                help="Paste one URL per line. Each URL adds the sheet its gid points to, or the first sheet if it has none.",
+                key="bulk_urls"
+            )
+            bulk_header_row = st.number_input(
+                "Header Row",
+                min_value=1,
+                max_value=10,
+                value=1,
+                key="bulk_header_row",
+                help="Which row contains the column headers?"
+            )
+            
+            if st.button("➕ Add URLs", key="add_bulk_urls", type="secondary", use_container_width=True):
+                urls = [line.strip() for line in bulk_urls.splitlines() if line.strip()]
+                if not urls:
+                    st.warning("⚠️ Paste at least one URL.")
+                else:
+                    try:
+                        with st.spinner("📥 Adding sheets..."):
+                            added, requested = st.session_state.combiner.add_sheets_from_urls(urls, bulk_header_row)
+                        
+                        if added:
+                            st.success(f"✅ Successfully added {added} of {requested} sheets!")
+                            time.sleep(1)
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ No sheets were added. They may be empty or inaccessible.")
+                    except ValueError as e:
+                        st.error(f"❌ Invalid URL: {e}")
+        
         st.markdown("---")
         
         # Management Section
@@ -669,11 +1315,14 @@ def main():
                     st.session_state.combiner.set_sheets_service(st.session_state.google_sheets_service)
                 st.session_state.available_sheets_info = []
                 st.session_state.last_sheet_url_input = ""
+                _discard_prepared_export()
                 st.success("🗑️ All sheets cleared!")
                 st.rerun()
         
         with col2:
             if st.button("🔄 Refresh", type="secondary", use_container_width=True):
+                st.cache_data.clear()
+                st.session_state.combiner.clear_cache()
                 st.rerun()
     
     # Main content area
@@ -688,8 +1337,8 @@ def main():
                 with st.container():
                     st.markdown(f"""
                     <div class="sheet-card">
-                        <h4>📄 {sheet['display_name']}</h4>
-                        <p><strong>Rows:</strong> {len(sheet['data'])} | <strong>Header Row:</strong> {sheet['header_row']}</p>
+                        <h4>📄 {sheet.display_name}</h4>
+                        <p><strong>Rows:</strong> {sheet.n_rows} | <strong>Header Row:</strong> {sheet.header_row}</p>
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -697,16 +1346,16 @@ def main():
                     
                     with col1:
                         if st.button(f"👁️ Preview Data", key=f"preview_{i}"):
-                            st.dataframe(sheet['data'].head(10), use_container_width=True)
+                            st.dataframe(sheet.preview, use_container_width=True)
                     
                     with col2:
                         if st.button(f"📊 Info", key=f"info_{i}"):
-                            st.info(f"**Sheet:** {sheet['name']}\n**Rows:** {len(sheet['data'])}\n**Columns:** {len(sheet['data'].columns)}")
+                            st.info(f"**Sheet:** {sheet.name}\n**Rows:** {sheet.n_rows}\n**Columns:** {sheet.n_cols}")
                     
                     with col3:
                         if st.button(f"🗑️ Remove", key=f"remove_{i}", type="secondary"):
-                            st.session_state.combiner.sheets_data.pop(i)
-                            st.success(f"Removed '{sheet['display_name']}'")
+                            st.session_state.combiner.remove_sheet(i)
+                            st.success(f"Removed '{sheet.display_name}'")
                             st.rerun()
         
         st.markdown("---")
@@ -721,96 +1370,135 @@ def main():
                 if st.button("🔄 Combine Sheets", type="primary", use_container_width=True):
                     try:
                         with st.spinner("🔄 Combining sheets..."):
-                            combined_df = st.session_state.combiner.combine_sheets()
-                            summary = st.session_state.combiner.get_summary()
+                            st.session_state.combiner.combine_sheets()
+                            _discard_prepared_export()
                         
                         st.success("✅ Sheets combined successfully!")
                         
-                        # Display summary
-                        st.markdown("### 📊 Summary")
-                        
-                        metric_cols = st.columns(3)
-                        with metric_cols[0]:
-                            st.metric("Total Rows", summary['total_rows'])
-                        with metric_cols[1]:
-                            st.metric("Total Columns", summary['total_columns'])
-                        with metric_cols[2]:
-                            st.metric("Sheets Combined", len(summary['sheets']))
-                        
-                        # Sheet breakdown
-                        st.markdown("#### 📋 Sheet Breakdown")
-                        for sheet_stat in summary['sheets']:
-                            st.markdown(f"""
-                            <div class="metric-container">
-                                <strong>{sheet_stat['name']}</strong>: {sheet_stat['rows']} rows (Header Row: {sheet_stat['header_row']})
-                            </div>
-                            """, unsafe_allow_html=True)
-                        
-                        # Preview combined data
-                        st.markdown("### 👁️ Combined Data Preview")
-                        st.dataframe(combined_df.head(20), use_container_width=True)
-                        
                     except Exception as e:
                         st.error(f"❌ Error combining sheets: {str(e)}")
             
-            with col2:
-                if st.session_state.combiner.combined_data is not None and not st.session_state.combiner.combined_data.empty:
-                    # Export options
-                    st.markdown("### 💾 Export Options")
-                    
-                    export_format = st.selectbox(
-                        "Select Export Format",
-                        options=["CSV", "Excel", "JSON"],
-                        key="export_format"
-                    )
-                    
-                    filename = st.text_input(
-                        "Filename (without extension)",
-                        value=f"combined_sheets_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                        key="export_filename"
+            combined_df = st.session_state.combiner.combined_data
+            if combined_df is not None and not combined_df.empty:
+                with col2:
+                    # Skips the summary, preview and export widgets entirely on reruns while turned off
+                    show_preview = st.toggle(
+                        "Show combined data & downloads",
+                        value=True,
+                        key="show_preview"
                     )
-                    
-                    if st.button("💾 Download", type="primary", use_container_width=True):
-                        try:
-                            if export_format == "CSV":
-                                csv_data = st.session_state.combiner.combined_data.to_csv(index=False)
-                                st.download_button(
-                                    label="📥 Download CSV",
-                                    data=csv_data,
-                                    file_name=f"{filename}.csv",
-                                    mime="text/csv",
-                                    use_container_width=True
-                                )
+                
+                if show_preview:
+                    with st.expander("📊 Combined Data & Downloads", expanded=True):
+                        col1, col2 = st.columns(2)
+                        
+                        with col1:
+                            summary = _cached_summary(st.session_state.combiner.cache_key, st.session_state.combiner)
                             
-                            elif export_format == "Excel":
-                                output = io.BytesIO()
-                                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                                    st.session_state.combiner.combined_data.to_excel(writer, index=False, sheet_name='Combined')
-                                excel_data = output.getvalue()
-                                
-                                st.download_button(
-                                    label="📥 Download Excel",
-                                    data=excel_data,
-                                    file_name=f"{filename}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                    use_container_width=True
-                                )
+                            # Display summary
+                            st.markdown("### 📊 Summary")
                             
-                            elif export_format == "JSON":
-                                json_data = st.session_state.combiner.combined_data.to_json(orient='records', indent=2)
-                                st.download_button(
-                                    label="📥 Download JSON",
-                                    data=json_data,
-                                    file_name=f"{filename}.json",
-                                    mime="application/json",
-                                    use_container_width=True
-                                )
+                            metric_cols = st.columns(3)
+                            with metric_cols[0]:
+                                st.metric("Total Rows", summary['total_rows'])
+                            with metric_cols[1]:
+                                st.metric("Total Columns", summary['total_columns'])
+                            with metric_cols[2]:
+                                st.metric("Sheets Combined", len(summary['sheets']))
                             
-                            st.success(f"✅ {export_format} file ready for download!")
+                            # Sheet breakdown
+                            st.markdown("#### 📋 Sheet Breakdown")
+                            # One markdown element for all sheets instead of one per sheet
+                            st.markdown("\n".join(
+                                f'<div class="metric-container"><strong>{sheet_stat["name"]}</strong>: '
+                                f'{sheet_stat["rows"]} rows (Header Row: {sheet_stat["header_row"]})</div>'
+                                for sheet_stat in summary['sheets']
+                            ), unsafe_allow_html=True)
                             
-                        except Exception as e:
-                            st.error(f"❌ Error exporting data: {str(e)}")
-                else:
+                            # Preview combined data; only the previewed rows are sent to the browser
+                            st.markdown("### 👁️ Combined Data Preview")
+                            preview_rows = st.slider(
+                                "Preview rows",
+                                min_value=100,
+                                max_value=5000,
+                                value=500,
+                                step=100,
+                                key="preview_rows",
+                                help="Number of rows shown below. Downloads always include every row."
+                            )
+                            # Slicing the Arrow table is zero-copy and st.dataframe sends it without a pandas conversion
+                            st.dataframe(st.session_state.combiner.combined_table.slice(0, preview_rows), use_container_width=True)
+                        
+                        with col2:
+                            # Export options
+                            st.markdown("### 💾 Export Options")
+                            
+                            export_format = st.selectbox(
+                                "Select Export Format",
+                                options=list(EXPORT_FORMATS),
+                                key="export_format"
+                            )
+                            
+                            filename = st.text_input(
+                                "Filename (without extension)",
+                                value=st.session_state.default_filename,
+                                key="export_filename"
+                            )
+                            
+                            large_export = export_format == "CSV" and st.checkbox(
+                                "Large export",
+                                key="large_export",
+                                help="Write the CSV to a temporary file on the server instead of storing it in session state."
+                            )
+                            
+                            # Serialize only on request; the prepared file survives reruns until the data changes
+                            if st.button("💾 Prepare Download", type="primary", use_container_width=True):
+                                try:
+                                    combined_data = st.session_state.combiner.combined_data
+                                    export_data = export_path = None
+                                    with st.spinner(f"💾 Preparing {export_format} file..."):
+                                        if large_export:
+                                            export_path = _to_csv_tempfile(combined_data)
+                                        elif export_format == "CSV":
+                                            export_data = _to_csv_bytes(combined_data)
+                                        elif export_format == "Excel":
+                                            export_data = _to_xlsx_bytes(combined_data)
+                                        elif export_format == "JSON":
+                                            export_data = combined_data.to_json(orient='records', indent=2)
+                                        elif export_format == "Parquet":
+                                            # Written from the combined snapshot so it matches the preview and other formats
+                                            export_path = _to_parquet_tempfile(st.session_state.combiner.combined_table)
+                                    
+                                    _discard_prepared_export()
+                                    st.session_state.prepared_export = {
+                                        "format": export_format,
+                                        "data": export_data,
+                                        "path": export_path,
+                                    }
+                                
+                                except Exception as e:
+                                    st.error(f"❌ Error exporting data: {str(e)}")
+                            
+                            prepared_export = st.session_state.prepared_export
+                            if prepared_export and prepared_export["path"] and not os.path.exists(prepared_export["path"]):
+                                # Pruned after sitting unused for EXPORT_TEMPFILE_TTL; prepare it again
+                                _discard_prepared_export()
+                                prepared_export = None
+                            if prepared_export and prepared_export["format"] == export_format:
+                                extension, mime = EXPORT_FORMATS[export_format]
+                                export_path = prepared_export["path"]
+                                # File-backed exports stay out of session state; the button still reads the file into memory on each rerun
+                                with (open(export_path, 'rb') if export_path else nullcontext(prepared_export["data"])) as data:
+                                    st.download_button(
+                                        label=f"📥 Download {export_format}",
+                                        data=data,
+                                        file_name=f"{filename}.{extension}",
+                                        mime=mime,
+                                        use_container_width=True
+                                    )
+                                st.success(f"✅ {export_format} file ready for download!")
+            else:
+                with col2:
                     st.info("💡 Combine sheets first to enable export options")
         
     else:
@@ -854,7 +1542,7 @@ def main():
             st.markdown("""
             <div class="sheet-card">
                 <h4>💾 Export Options</h4>
-                <p>Download combined data in CSV, Excel, or JSON format</p>
+                <p>Download combined data in CSV, Excel, JSON, or Parquet format</p>
             </div>
             """, unsafe_allow_html=True)
     
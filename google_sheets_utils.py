@@ -1,16 +1,139 @@
 import os
 import time
 import json
+import hashlib
+import random
+import functools
+import re
+import threading
+from datetime import datetime, timedelta
 import streamlit as st
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
+from google.auth.exceptions import GoogleAuthError
 
 # Scope for Google Sheets (read-only)
 SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 
+# Spreadsheet ID in a Google Sheets URL
+SHEET_ID_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+
+# Sheets API statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_ATTEMPTS = 5
+
+# Refresh the access token this long before it expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# OAuth client config file, the alternative to st.secrets['google']['credentials_json']
+CREDENTIALS_FILE = 'credentials.json'
+
+# API clients are cached per token; access tokens last about an hour, so older clients are dropped
+CLIENT_CACHE_TTL = 3600
+CLIENT_CACHE_ENTRIES = 32
+
+# Serializes token refreshes across every session and rerun; lives here because app.py is re-executed per rerun
+token_refresh_lock = threading.Lock()
+
+def with_backoff(fn):
+    """Retry a Sheets API call on 429/5xx with exponential backoff plus jitter"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return fn(*args, **kwargs)
+            except HttpError as e:
+                if e.resp.status not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(min(2 ** attempt, 32) + random.random())
+    return wrapper
+
+def credentials_from_token_info(token_info, scopes=SHEETS_SCOPES):
+    """Rebuild Credentials from a stored token dict, including grants that came without a refresh token"""
+    if token_info.get('refresh_token'):
+        return Credentials.from_authorized_user_info(token_info, scopes)
+    # from_authorized_user_info insists on a refresh token, which select_account sign-ins may not get
+    expiry = token_info.get('expiry')
+    return Credentials(
+        token=token_info.get('token'),
+        token_uri=token_info.get('token_uri'),
+        client_id=token_info.get('client_id'),
+        client_secret=token_info.get('client_secret'),
+        scopes=scopes,
+        expiry=datetime.strptime(expiry.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S') if expiry else None)
+
+def token_fingerprint(token_info):
+    """Stable hash of a token dict, used to scope cached clients and API results to one user"""
+    return hashlib.sha1(json.dumps(token_info, sort_keys=True).encode()).hexdigest()
+
+def token_needs_refresh(creds):
+    """Check whether the access token has expired or expires within TOKEN_REFRESH_MARGIN"""
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+@st.cache_resource(ttl=CLIENT_CACHE_TTL, max_entries=CLIENT_CACHE_ENTRIES, show_spinner=False)
+def build_sheets_service(token_hash, _token_info):
+    """Build the Sheets API client once per token instead of on every call"""
+    creds = credentials_from_token_info(_token_info)
+    # Use the discovery document bundled with googleapiclient rather than fetching it
+    return build("sheets", "v4", credentials=creds, cache_discovery=False, static_discovery=True)
+
+def ensure_fresh(creds):
+    """Refresh the access token shortly before it expires and store the new token in session state"""
+    if not creds.refresh_token or not token_needs_refresh(creds):
+        return creds
+    with token_refresh_lock:
+        # Another rerun may have refreshed the token while we waited for the lock
+        if "sheets_token_info" in st.session_state:
+            creds = credentials_from_token_info(st.session_state.sheets_token_info, creds.scopes)
+            if not token_needs_refresh(creds):
+                return creds
+        try:
+            creds.refresh(Request())
+        except GoogleAuthError:
+            # A token that is still valid keeps working; the refresh is retried on the next call
+            if not creds.valid:
+                raise
+            return creds
+        st.session_state.sheets_token_info = json.loads(creds.to_json())
+    return creds
+
+def _cached_sheets_service(token_info):
+    """Return the cached Sheets API client for a token"""
+    return build_sheets_service(token_fingerprint(token_info), token_info)
+
+def _read_credentials_file():
+    """Parse CREDENTIALS_FILE, or return None if it doesn't exist"""
+    if not os.path.exists(CREDENTIALS_FILE):
+        return None
+    try:
+        with open(CREDENTIALS_FILE, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        raise ValueError(f"Error loading {CREDENTIALS_FILE}: {str(e)}") from None
+
+def _read_secrets_config():
+    """Parse st.secrets['google']['credentials_json'], or return None if it isn't configured"""
+    if "google" not in st.secrets or "credentials_json" not in st.secrets["google"]:
+        return None
+    try:
+        return json.loads(st.secrets["google"]["credentials_json"])
+    except json.JSONDecodeError:
+        raise ValueError("Error: st.secrets['google']['credentials_json'] is not a valid JSON string.") from None
+
+@st.cache_resource(show_spinner=False)
+def load_oauth_client_config(secrets_first=False):
+    """Parse the OAuth client config once per process, from credentials.json and st.secrets in the given order"""
+    # Errors are raised rather than returned so they are never cached and a fixed config is picked up
+    readers = (_read_secrets_config, _read_credentials_file) if secrets_first else (_read_credentials_file, _read_secrets_config)
+    for reader in readers:
+        config = reader()
+        if config is not None:
+            return config
+    raise ValueError(f"Google credentials missing. Please provide '{CREDENTIALS_FILE}' in the app directory or configure st.secrets['google']['credentials_json'].")
+
 def sheets_authenticate():
     """Authenticate with Google Sheets API for both local and Streamlit Cloud"""
     creds = None
@@ -18,38 +141,21 @@ def sheets_authenticate():
     # Check for existing token in session state
     if "sheets_token_info" in st.session_state:
         try:
-            creds = Credentials.from_authorized_user_info(
-                st.session_state.sheets_token_info, SHEETS_SCOPES)
-            if creds and creds.valid:
-                return build("sheets", "v4", credentials=creds)
-            elif creds and creds.expired and creds.refresh_token:
-                st.info("Refreshing Google Sheets credentials...")
-                creds.refresh(Request())
-                st.session_state.sheets_token_info = json.loads(creds.to_json())
-                st.info("Sheets token refreshed successfully.")
-                return build("sheets", "v4", credentials=creds)
+            creds = credentials_from_token_info(st.session_state.sheets_token_info)
+            # Refresh ahead of expiry so the first API call never waits on an expired token
+            creds = ensure_fresh(creds)
+            if creds.valid:
+                return _cached_sheets_service(st.session_state.sheets_token_info)
         except Exception as e:
             st.error(f"Failed to use cached token: {str(e)}")
             if "sheets_token_info" in st.session_state:
                 del st.session_state["sheets_token_info"]
     
     # Load credentials from Streamlit secrets or credentials.json
-    creds_data = None
-    if "google" in st.secrets and "credentials_json" in st.secrets["google"]:
-        try:
-            creds_data = json.loads(st.secrets["google"]["credentials_json"])
-        except json.JSONDecodeError:
-            st.error("Error: st.secrets['google']['credentials_json'] is not valid JSON.")
-            return None
-    elif os.path.exists('credentials.json'):
-        try:
-            with open('credentials.json', 'r') as f:
-                creds_data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            st.error(f"Error loading credentials.json: {str(e)}")
-            return None
-    else:
-        st.error("Google credentials missing. Configure st.secrets or add credentials.json.")
+    try:
+        creds_data = load_oauth_client_config(secrets_first=True)
+    except ValueError as e:
+        st.error(str(e))
         return None
     
     # Determine redirect URI based on environment
@@ -67,8 +173,11 @@ def sheets_authenticate():
         redirect_uri=redirect_uri
     )
     
-    # Generate authorization URL
-    auth_url, _ = flow.authorization_url(prompt='consent')
+    # Generate authorization URL; returning users only pick their account
+    auth_url, _ = flow.authorization_url(
+        prompt='consent' if st.session_state.get("sheets_needs_consent") else 'select_account',
+        access_type='offline',
+        include_granted_scopes='true')
     
     # Check for callback code
     if "code" in st.query_params:
@@ -79,11 +188,13 @@ def sheets_authenticate():
             
             # Save credentials in session state
             st.session_state.sheets_token_info = json.loads(creds.to_json())
+            # Google only issues a refresh token on consent; without one, ask for consent next time
+            st.session_state.sheets_needs_consent = not creds.refresh_token
             st.success("Successfully connected to Google Sheets API!")
             
             # Clear code from URL
             st.experimental_set_query_params()
-            return build("sheets", "v4", credentials=creds)
+            return _cached_sheets_service(st.session_state.sheets_token_info)
         except Exception as e:
             st.error(f"Authentication failed: {str(e)}. Please try again.")
             st.experimental_set_query_params()
@@ -97,4 +208,24 @@ def sheets_authenticate():
         """)
         st.stop()
     
-    return None
\ No newline at end of file
+    return None
+
+@functools.lru_cache(maxsize=256)
+def extract_sheet_id(url):
+    """Extract the spreadsheet ID from a Google Sheets URL, memoized for the life of the process"""
+    match = SHEET_ID_RE.search(url)
+    if not match:
+        raise ValueError(f"Invalid Google Sheets URL format: {url}")
+    return match.group(1)
+
+@with_backoff
+def batch_get_values(service, spreadsheet_id, ranges, value_render_option='UNFORMATTED_VALUE',
+                     date_time_render_option='FORMATTED_STRING'):
+    """Fetch several ranges of a spreadsheet in one batchGet request, returning its valueRanges"""
+    return service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=list(ranges),
+        majorDimension='ROWS',
+        valueRenderOption=value_render_option,
+        dateTimeRenderOption=date_time_render_option
+    ).execute().get('valueRanges', [])